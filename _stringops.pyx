@@ -0,0 +1,249 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+C versions of the string kernels of nonneural_tur.py: hamming, the halign offset
+search, and levenshtein with alignments (Myers' bit-parallel algorithm for unit
+costs on strings of up to 64 characters, the weighted table otherwise).
+Results are identical to the Python versions, including how ties are broken.
+
+nonneural_tur.py uses this module when it has been built in place next to it:
+    CFLAGS="-O3 -march=native" cythonize -i -3 _stringops.pyx
+"""
+
+from cpython.unicode cimport PyUnicode_FromKindAndData, PyUnicode_4BYTE_KIND
+from libc.stdint cimport uint64_t
+from libc.stdlib cimport malloc, free
+
+cdef double TIE_EPS = 1e-9 # must match TIE_EPS in nonneural_tur.py
+cdef Py_UCS4 GAP = u'_'
+
+
+cpdef Py_ssize_t hamming_int(unicode s, unicode t):
+    """
+    Hamming distance between two strings, over the length of the shorter one.
+    """
+    cdef Py_ssize_t i, d = 0
+    for i in range(min(len(s), len(t))):
+        if s[i] != t[i]:
+            d += 1
+    return d
+
+
+cpdef Py_ssize_t halign_int(unicode s, unicode t):
+    """
+    Offset of s against t (s[0] sitting under t[offset]) with the fewest mismatches,
+    as found by _halign_offset in nonneural_tur.py.
+    """
+    cdef Py_ssize_t slen = len(s), tlen = len(t)
+    cdef Py_ssize_t ssyms = slen - s.count(u'_'), tsyms = tlen - t.count(u'_')
+    cdef Py_ssize_t minscore = slen + tlen + 1, best = 0
+    cdef Py_ssize_t offset, lo, hi, i, score
+    cdef Py_UCS4 a, b
+    for offset in range(-slen, tlen + 1):
+        lo = max(0, -offset)
+        hi = min(slen, tlen - offset)
+        # mismatches in the overlap plus the symbols of s and t hanging outside it
+        score = ssyms + tsyms
+        if hi > lo:
+            score -= 2 * (hi - lo)
+            for i in range(lo, hi):
+                a = s[i]
+                b = t[i + offset]
+                score += (a != b) + (a == GAP) + (b == GAP)
+        if score < minscore:
+            best = offset
+            minscore = score
+    return best
+
+
+def levenshtein_align(unicode s, unicode t, double inscost = 1.0, double delcost = 1.0, double substcost = 1.0):
+    """
+    Levenshtein alignment of two strings, as returned by levenshtein in nonneural_tur.py.
+
+    Return:
+        aligned s, aligned t (gaps written as '_'), and the alignment cost
+    """
+    cdef Py_ssize_t n = len(s), m = len(t), i, j, k
+    cdef Py_UCS4 *sc = <Py_UCS4 *> malloc((n + 1) * sizeof(Py_UCS4))
+    cdef Py_UCS4 *tc = <Py_UCS4 *> malloc((m + 1) * sizeof(Py_UCS4))
+    cdef Py_UCS4 *outs = <Py_UCS4 *> malloc((n + m + 1) * sizeof(Py_UCS4))
+    cdef Py_UCS4 *outt = <Py_UCS4 *> malloc((n + m + 1) * sizeof(Py_UCS4))
+    cdef unsigned char *ops = <unsigned char *> malloc(n + m + 1)
+    cdef unsigned char op
+    cdef double cost
+    try:
+        if not sc or not tc or not outs or not outt or not ops:
+            raise MemoryError()
+        for i in range(n):
+            sc[i] = s[i]
+        for j in range(m):
+            tc[j] = t[j]
+
+        if inscost == 1.0 and delcost == 1.0 and substcost == 1.0 and 0 < n <= 64 and 0 < m <= 64:
+            cost = _myers(sc, n, tc, m, ops)
+        else:
+            cost = _table(sc, n, tc, m, inscost, delcost, substcost, ops)
+
+        i = j = k = 0
+        while i < n or j < m:
+            op = ops[k]
+            if op == 0:
+                outs[k] = sc[i]
+                outt[k] = tc[j]
+                i += 1
+                j += 1
+            elif op == 1:
+                outs[k] = GAP
+                outt[k] = tc[j]
+                j += 1
+            else:
+                outs[k] = sc[i]
+                outt[k] = GAP
+                i += 1
+            k += 1
+        return (PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, outs, k),
+                PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, outt, k), cost)
+    finally:
+        free(sc)
+        free(tc)
+        free(outs)
+        free(outt)
+        free(ops)
+
+
+cdef double _table(const Py_UCS4 *sc, Py_ssize_t n, const Py_UCS4 *tc, Py_ssize_t m,
+                   double inscost, double delcost, double substcost, unsigned char *ops) except? -1:
+    """
+    Weighted Levenshtein table over suffixes, as _lev_dp in nonneural_tur.py.
+    Writes the operations (0 = match/substitute, 1 = insert, 2 = delete) to ops
+    and returns the alignment cost.
+    """
+    cdef double *prev = <double *> malloc((m + 1) * sizeof(double))
+    cdef double *curr = <double *> malloc((m + 1) * sizeof(double))
+    cdef double *tmp
+    cdef unsigned char *back = <unsigned char *> malloc(n * m + 1)
+    cdef Py_ssize_t i, j, k
+    cdef unsigned char op
+    cdef double cost
+    try:
+        if not prev or not curr or not back:
+            raise MemoryError()
+        for j in range(m + 1):
+            prev[j] = m - j
+        for i in range(n - 1, -1, -1):
+            curr[m] = n - i
+            for j in range(m - 1, -1, -1):
+                cost = prev[j + 1]
+                if sc[i] != tc[j]:
+                    cost += substcost
+                op = 0
+                if curr[j + 1] + inscost < cost - TIE_EPS:
+                    cost = curr[j + 1] + inscost
+                    op = 1
+                if prev[j] + delcost < cost - TIE_EPS:
+                    cost = prev[j] + delcost
+                    op = 2
+                curr[j] = cost
+                back[i * m + j] = op
+            tmp = prev
+            prev = curr
+            curr = tmp
+
+        i = j = k = 0
+        while i < n and j < m:
+            op = back[i * m + j]
+            ops[k] = op
+            k += 1
+            if op != 1:
+                i += 1
+            if op != 2:
+                j += 1
+        while j < m:
+            ops[k] = 1
+            k += 1
+            j += 1
+        while i < n:
+            ops[k] = 2
+            k += 1
+            i += 1
+        return prev[0]
+    finally:
+        free(prev)
+        free(curr)
+        free(back)
+
+
+cdef inline Py_ssize_t _popcount(uint64_t x) nogil:
+    x = x - ((x >> 1) & 0x5555555555555555ULL)
+    x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL)
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0FULL
+    return <Py_ssize_t> ((x * 0x0101010101010101ULL) >> 56)
+
+
+cdef inline Py_ssize_t _dist(const uint64_t *vps, const uint64_t *vns, Py_ssize_t n, Py_ssize_t m,
+                             Py_ssize_t i, Py_ssize_t j) nogil:
+    """Distance between s[i:] and t[j:], read off the stored column bit-vectors."""
+    cdef Py_ssize_t rows = n - i
+    cdef uint64_t below = ~(<uint64_t> 0) if rows == 64 else ((<uint64_t> 1) << rows) - 1
+    return m - j + _popcount(vps[m - j] & below) - _popcount(vns[m - j] & below)
+
+
+cdef double _myers(const Py_UCS4 *sc, Py_ssize_t n, const Py_UCS4 *tc, Py_ssize_t m, unsigned char *ops):
+    """
+    Unit-cost Levenshtein with Myers' bit-parallel algorithm for 1 <= n, m <= 64,
+    as _myers_distance_and_ops in nonneural_tur.py. Writes the operations to ops
+    and returns the distance.
+    """
+    cdef uint64_t vps[65]
+    cdef uint64_t vns[65]
+    cdef uint64_t mask = ~(<uint64_t> 0) >> (64 - n)
+    cdef uint64_t vp = mask, vn = 0, eq, xv, xh, hp, hn
+    cdef Py_ssize_t i, j, k, cost, alt
+    cdef Py_UCS4 c
+    cdef unsigned char op
+
+    # The reversed strings are pattern and text, so columns hold distances between suffixes
+    vps[0] = vp
+    vns[0] = vn
+    for j in range(m):
+        c = tc[m - 1 - j]
+        eq = 0
+        for i in range(n):
+            if sc[n - 1 - i] == c:
+                eq |= (<uint64_t> 1) << i
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | ~(xh | vp)
+        hn = vp & xh
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(xv | hp) & mask)
+        vn = hp & xv
+        vps[j + 1] = vp
+        vns[j + 1] = vn
+
+    # Walk from the start of both strings, breaking ties like the table
+    i = j = k = 0
+    while i < n and j < m:
+        cost = _dist(vps, vns, n, m, i + 1, j + 1) + (sc[i] != tc[j])
+        op = 0
+        alt = _dist(vps, vns, n, m, i, j + 1) + 1
+        if alt < cost:
+            cost = alt
+            op = 1
+        if _dist(vps, vns, n, m, i + 1, j) + 1 < cost:
+            op = 2
+        ops[k] = op
+        k += 1
+        if op != 1:
+            i += 1
+        if op != 2:
+            j += 1
+    while j < m:
+        ops[k] = 1
+        k += 1
+        j += 1
+    while i < n:
+        ops[k] = 2
+        k += 1
+        i += 1
+    return _dist(vps, vns, n, m, 0, 0)
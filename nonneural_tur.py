@@ -9,7 +9,33 @@ Last Update: 22/03/2021
 """
 
 import sys, os, getopt
-from functools import wraps
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from operator import ne
+
+try: # numba is optional; without it levenshtein runs in pure Python
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
+try: # pyahocorasick is optional; without it rules are matched one by one
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try: # C string kernels, built from _stringops.pyx (see there); used in preference to everything else
+    from _stringops import hamming_int, halign_int, levenshtein_align
+except ImportError:
+    hamming_int = halign_int = levenshtein_align = None
+
+TIE_EPS = 1e-9 # costs closer than this are considered equal in levenshtein
+_STRIP_UNDERSCORE = str.maketrans('', '', '_') # for str.translate: drop alignment gaps
+_STRIP_MARKERS = str.maketrans('', '', '<>') # for str.translate: drop word boundary markers
 
 def hamming(s,t):
     """
@@ -22,7 +48,9 @@ def hamming(s,t):
     Return:  
         value of hamming distance
     """
-    return sum(1 for x,y in zip(s,t) if x != y)
+    if hamming_int is not None:
+        return hamming_int(s, t)
+    return sum(map(ne, s, t)) # compares and counts in C, one pass over both strings
 
 
 def halign(s,t):
@@ -38,68 +66,297 @@ def halign(s,t):
     """
     slen = len(s)
     tlen = len(t)
+    best = _halign_offset(s, t)
+    start = min(0, best)
+    end = max(tlen, best + slen)
+    bu = '_' * (best - start) + s + '_' * (end - best - slen)
+    bl = '_' * -start + t + '_' * (end - tlen)
+
+    newin, newout = [], []
+    for i, o in zip(bu, bl):
+        if i != '_' or o != '_':
+            newin.append(i)
+            newout.append(o)
+    return ''.join(newin), ''.join(newout)
+
+
+def halign_bias(s,t):
+    """
+    Count the padding halign would put around two strings, without building the alignment.
+
+    Args:
+        s   string 1
+        t   string 2
+
+    Return:
+        number of leading '_' in aligned s and t, then number of trailing '_' in aligned s and t
+    """
+    # Underscores in the input mix with the padding, and an empty string is all padding;
+    # in those cases count on the alignment itself
+    if not s or not t or '_' in s or '_' in t:
+        aligned = halign(s, t)
+        return (numleadingsyms(aligned[0], '_'), numleadingsyms(aligned[1], '_'),
+                numtrailingsyms(aligned[0], '_'), numtrailingsyms(aligned[1], '_'))
+    best = _halign_offset(s, t)
+    return max(0, best), max(0, -best), max(0, len(t) - best - len(s)), max(0, best + len(s) - len(t))
+
+
+@lru_cache(maxsize = None)
+def _halign_offset(s,t):
+    """
+    Find the offset of s against t (s[0] sitting under t[offset]) with the fewest mismatches.
+    Results are cached across calls (cleared for each language in main).
+    """
+    if halign_int is not None:
+        return halign_int(s, t)
+    slen = len(s)
+    tlen = len(t)
+    # Characters other than '_' never match the '_' padding
+    ssyms = slen - s.count('_')
+    tsyms = tlen - t.count('_')
     minscore = slen + tlen + 1
 
-    for upad in range(0, tlen+1):
-        upper = '_' * upad + s + (tlen - upad) * '_'
-        lower = slen * '_' + t
-        score = hamming(upper, lower)
+    # Slide s along t; only the overlap needs comparing
+    for offset in range(-slen, tlen+1):
+        lo = max(0, -offset)
+        hi = min(slen, tlen - offset)
+        if hi > lo:
+            sover = s[lo:hi]
+            tover = t[lo+offset:hi+offset]
+            # mismatches in the overlap plus the symbols of s and t hanging outside it
+            score = hamming(sover, tover) + ssyms + tsyms - 2 * (hi - lo) + sover.count('_') + tover.count('_')
+        else:
+            score = ssyms + tsyms
         if score < minscore:
-            bu = upper
-            bl = lower
+            best = offset
             minscore = score
+    return best
 
-    for lpad in range(0, slen+1):
-        upper = tlen * '_' + s
-        lower = (slen - lpad) * '_' + t + '_' * lpad
-        score = hamming(upper, lower)
-        if score < minscore:
-            bu = upper
-            bl = lower
-            minscore = score
 
-    zipped = list(zip(bu,bl))
-    newin  = ''.join(i for i,o in zipped if i != '_' or o != '_')
-    newout = ''.join(o for i,o in zipped if i != '_' or o != '_')
-    return newin, newout
+@lru_cache(maxsize = 1 << 17)
+def levenshtein(s, t, inscost = 1.0, delcost = 1.0, substcost = 1.0):
+    """
+    Iterative (Wagner-Fischer) implementation of Levenshtein, with alignments returned.
+
+    The table is filled over suffixes of s and t, keeping only two rows of costs
+    and a byte per cell recording the chosen operation (0 = match/substitute,
+    1 = insert, 2 = delete). Ties are broken in that same order, as in the
+    original recursive version; costs within TIE_EPS of each other count as
+    ties, so that e.g. 1.1 + 1.0 and 1.0 + 1.1 are not told apart by rounding.
+    The whole alignment is done in C if the _stringops extension has been built;
+    otherwise the table is filled by a compiled kernel if numba is available.
+    Without either, unit costs and strings of up to 64 characters use Myers'
+    bit-parallel algorithm. Results are cached across calls (cleared for each
+    language in main).
 
+    Args:
+        s           string 1
+        t           string 2
+        inscost     cost of inserting a character of t
+        delcost     cost of deleting a character of s
+        substcost   cost of substituting one character for another
 
-def levenshtein(s, t, inscost = 1.0, delcost = 1.0, substcost = 1.0):
+    Return:
+        aligned s, aligned t (gaps written as '_'), and the alignment cost
     """
-    Recursive implementation of Levenshtein, with alignments returned.
+    if s == t:
+        return s, t, 0.0
+    # Equal lengths and a single mismatch: any alignment with gaps needs at least one
+    # insertion and one deletion, so if those cost no less than a substitution the
+    # table would pick the plain substitution as well (it wins ties)
+    if len(s) == len(t) and substcost <= min(inscost, 1.0) + min(delcost, 1.0) and hamming(s, t) == 1:
+        return s, t, float(substcost)
+
+    if levenshtein_align is not None:
+        return levenshtein_align(s, t, inscost, delcost, substcost)
+
+    if _lev_dp is not None:
+        cost, ops = _lev_dp(_codepoints(s), _codepoints(t), inscost, delcost, substcost)
+        ops = ops.tobytes()
+    elif inscost == delcost == substcost == 1.0 and 0 < len(s) <= 64 and 0 < len(t) <= 64:
+        cost, ops = _myers_distance_and_ops(s, t)
+    else:
+        cost, ops = _lev_dp_py(s, t, inscost, delcost, substcost)
+
+    # Only the operations are kept by the table; build the aligned strings once
+    aligneds, alignedt = [], []
+    i = j = 0
+    for op in ops:
+        if op == 0:
+            aligneds.append(s[i])
+            alignedt.append(t[j])
+            i += 1
+            j += 1
+        elif op == 1:
+            aligneds.append('_')
+            alignedt.append(t[j])
+            j += 1
+        else:
+            aligneds.append(s[i])
+            alignedt.append('_')
+            i += 1
+    return ''.join(aligneds), ''.join(alignedt), float(cost)
+
+
+def _myers_distance_and_ops(s, t):
     """
-    @memolrec
-    def lrec(spast, tpast, srem, trem, cost):
-        if len(srem) == 0:
-            return spast + len(trem) * '_', tpast + trem, '', '', cost + len(trem)
-        if len(trem) == 0:
-            return spast + srem, tpast + len(srem) * '_', '', '', cost + len(srem)
+    Unit-cost Levenshtein with Myers' bit-parallel algorithm, for strings of up to 64 characters.
 
-        addcost = 0
-        if srem[0] != trem[0]:
-            addcost = substcost
+    The reversed strings are used as pattern and text, so that column j of the
+    bit-vectors holds the distances between suffixes, as in the tables of
+    _lev_dp. One (VP, VN) pair per column is kept for the traceback.
 
-        return min((lrec(spast + srem[0], tpast + trem[0], srem[1:], trem[1:], cost + addcost),
-                   lrec(spast + '_', tpast + trem[0], srem, trem[1:], cost + inscost),
-                   lrec(spast + srem[0], tpast + '_', srem[1:], trem, cost + delcost)),
-                   key = lambda x: x[4])
+    Return:
+        edit distance and the sequence of operations, as returned by _lev_dp
+    """
+    n, m = len(s), len(t)
+    mask = (1 << n) - 1
+    peq = {}
+    for i, c in enumerate(reversed(s)):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    vp, vn = mask, 0
+    cols = [(vp, vn)]
+    for c in reversed(t):
+        eq = peq.get(c, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | ~(xh | vp)
+        hn = vp & xh
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(xv | hp) & mask)
+        vn = hp & xv
+        cols.append((vp, vn))
+
+    def dist(i, j):
+        """Distance between s[i:] and t[j:], read off the stored column bit-vectors."""
+        vp, vn = cols[m - j]
+        below = (1 << (n - i)) - 1
+        return m - j + (vp & below).bit_count() - (vn & below).bit_count()
+
+    # Walk from the start of both strings, breaking ties like _lev_dp
+    ops = bytearray()
+    i = j = 0
+    while i < n and j < m:
+        cost = dist(i + 1, j + 1) + (s[i] != t[j])
+        op = 0
+        if dist(i, j + 1) + 1 < cost:
+            cost = dist(i, j + 1) + 1
+            op = 1
+        if dist(i + 1, j) + 1 < cost:
+            op = 2
+        ops.append(op)
+        if op != 1:
+            i += 1
+        if op != 2:
+            j += 1
+    ops.extend(b'\x01' * (m - j))
+    ops.extend(b'\x02' * (n - i))
+    return dist(0, 0), ops
+
+
+def _lev_dp_py(s, t, inscost, delcost, substcost):
+    """
+    Pure Python version of _lev_dp, used when numba is not installed.
+    """
+    n, m = len(s), len(t)
+    prev = array('d', range(m, -1, -1)) # costs for the empty suffix of s
+    curr = array('d', [0.0] * (m + 1))
+    back = bytearray(n * m)
+    for i in range(n - 1, -1, -1):
+        curr[m] = n - i
+        si = s[i]
+        for j in range(m - 1, -1, -1):
+            cost = prev[j + 1] + (substcost if si != t[j] else 0)
+            op = 0
+            if curr[j + 1] + inscost < cost - TIE_EPS:
+                cost = curr[j + 1] + inscost
+                op = 1
+            if prev[j] + delcost < cost - TIE_EPS:
+                cost = prev[j] + delcost
+                op = 2
+            curr[j] = cost
+            back[i * m + j] = op
+        prev, curr = curr, prev
+
+    # Walk the backpointers from the start of both strings
+    ops = bytearray()
+    i = j = 0
+    while i < n and j < m:
+        op = back[i * m + j]
+        ops.append(op)
+        if op != 1:
+            i += 1
+        if op != 2:
+            j += 1
+    ops.extend(b'\x01' * (m - j))
+    ops.extend(b'\x02' * (n - i))
+    return prev[0], ops
+
+
+def _codepoints(s):
+    """
+    Codepoints of a string as an int32 array, so that compiled kernels compare integers.
+    Encoding to UTF-32 and viewing the buffer avoids a Python-level ord() per character.
+    """
+    return np.frombuffer(s.encode('utf-32-le'), dtype = np.int32)
 
-    answer = lrec('', '', s, t, 0)
-    return answer[0],answer[1],answer[4]
 
+if njit is not None:
+    @njit(cache = True, fastmath = True)
+    def _lev_dp(s_arr, t_arr, inscost, delcost, substcost):
+        """
+        Compiled Levenshtein table for two arrays of codepoints.
 
-def memolrec(func):
-    """
-    Memoizer for Levenshtein.
-    """
-    cache = {}
-    @wraps(func)
-    def wrap(sp, tp, sr, tr, cost):
-        if (sr,tr) not in cache:
-            res = func(sp, tp, sr, tr, cost)
-            cache[(sr,tr)] = (res[0][len(sp):], res[1][len(tp):], res[4] - cost)
-        return sp + cache[(sr,tr)][0], tp + cache[(sr,tr)][1], '', '', cost + cache[(sr,tr)][2]
-    return wrap
+        Return:
+            alignment cost and the sequence of operations (0 = match/substitute,
+            1 = insert, 2 = delete) read from the start of both strings
+        """
+        n, m = s_arr.shape[0], t_arr.shape[0]
+        prev = np.empty(m + 1)
+        curr = np.empty(m + 1)
+        for j in range(m + 1):
+            prev[j] = m - j
+        back = np.zeros((n, m), dtype = np.uint8)
+        for i in range(n - 1, -1, -1):
+            curr[m] = n - i
+            for j in range(m - 1, -1, -1):
+                cost = prev[j + 1]
+                if s_arr[i] != t_arr[j]:
+                    cost += substcost
+                op = 0
+                if curr[j + 1] + inscost < cost - TIE_EPS:
+                    cost = curr[j + 1] + inscost
+                    op = 1
+                if prev[j] + delcost < cost - TIE_EPS:
+                    cost = prev[j] + delcost
+                    op = 2
+                curr[j] = cost
+                back[i, j] = op
+            prev, curr = curr, prev
+
+        ops = np.empty(n + m, dtype = np.uint8)
+        i = j = k = 0
+        while i < n and j < m:
+            op = back[i, j]
+            ops[k] = op
+            k += 1
+            if op != 1:
+                i += 1
+            if op != 2:
+                j += 1
+        while j < m:
+            ops[k] = 1
+            k += 1
+            j += 1
+        while i < n:
+            ops[k] = 2
+            k += 1
+            i += 1
+        return prev[0], ops[:k]
+else:
+    _lev_dp = None
 
 
 def alignprs(lemma, form):
@@ -145,10 +402,8 @@ def prefix_suffix_rules_get(lemma, form):
         Generate rules based on input and output strings.
         Removes underscores in the process.
         """
-        rules = set()
-        for i in range(min(len(ins), len(outs))):
-            rules.add((ins[i:], outs[i:]))
-        return {(x[0].replace('_', ''), x[1].replace('_', '')) for x in rules}
+        return {(ins[i:].translate(_STRIP_UNDERSCORE), outs[i:].translate(_STRIP_UNDERSCORE))
+                for i in range(min(len(ins), len(outs)))}
 
     # Generate suffix rules
     srules = generate_rules(lr + ls + ">", fr + fs + ">")
@@ -162,6 +417,83 @@ def prefix_suffix_rules_get(lemma, form):
 
     return prules, srules
 
+@dataclass
+class RuleSet:
+    """
+    The rules of one MSD as parallel arrays, ranked from most to least preferred,
+    so that the best applicable rule is the first one whose lhs occurs in the word.
+    """
+    lhs: list           # left-hand sides
+    rhs: list           # right-hand sides
+    counts: array       # number of training pairs each rule was seen in
+    automaton: object   # Aho-Corasick automaton from lhs to its first index, or None without pyahocorasick
+    buckets: dict       # without an automaton: rarest character of each lhs -> ascending rule indices
+    anywhere: int       # index of the first rule with an empty lhs (which matches anywhere), or len(lhs)
+
+    def find(self, base):
+        """
+        Find the best rule applicable to a word.
+
+        Args:
+            base    word, with '<' and '>' markers
+
+        Return:
+            index of the rule, or None if no rule applies
+        """
+        best = self.anywhere
+        if self.automaton is not None:
+            if len(self.automaton) > 0: # an automaton without words cannot be searched
+                for _, i in self.automaton.iter(base):
+                    if i < best:
+                        best = i
+        else:
+            # An lhs can only occur in base if its rarest character does,
+            # so only the buckets of characters in base need to be checked
+            for c in set(base):
+                for i in self.buckets.get(c, ()):
+                    if i >= best:
+                        break
+                    if self.lhs[i] in base:
+                        best = i
+                        break
+        return best if best < len(self.lhs) else None
+
+
+def build_rulesets(allrules, key):
+    """
+    Rank the rules of each MSD once after training.
+
+    Args:
+        allrules    prefix or suffix rule counts per MSD
+        key         preference of a rule, as a function of (lhs, rhs, count)
+
+    Return:
+        RuleSet per MSD
+    """
+    charfreq = Counter(c for rules in allrules.values() for lhs, _ in rules for c in lhs)
+    rulesets = {}
+    for msd, rules in allrules.items():
+        # sorted is stable, so rules with equal keys keep the order they were first seen in,
+        # which is the order max() would have broken ties in
+        ranked = sorted(rules.items(), key = lambda x: key(x[0][0], x[0][1], x[1]), reverse = True)
+        lhs = [r[0][0] for r in ranked]
+        automaton, buckets = None, None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for i, l in enumerate(lhs):
+                if l and l not in automaton: # the automaton cannot hold the empty string
+                    automaton.add_word(l, i)
+            automaton.make_automaton()
+        else:
+            buckets = {}
+            for i, l in enumerate(lhs):
+                if l:
+                    buckets.setdefault(min(l, key = charfreq.__getitem__), []).append(i)
+        rulesets[msd] = RuleSet(lhs, [r[0][1] for r in ranked], array('i', (r[1] for r in ranked)),
+                                automaton, buckets, lhs.index('') if '' in lhs else len(lhs))
+    return rulesets
+
+
 def apply_best_rule(lemma, msd, allprules, allsrules):
     """
     Applies the longest-matching suffix-changing rule given an input form and the MSD. 
@@ -171,8 +503,8 @@ def apply_best_rule(lemma, msd, allprules, allsrules):
     Args:
         lemma       word to be transformed
         msd         morphological description of the lemma
-        allprules   set of prefix rules
-        allsrules   set of suffix rules
+        allprules   prefix rules, as RuleSets from build_rulesets
+        allsrules   suffix rules, as RuleSets from build_rulesets
     
     Return:
         inflected version of the lemma
@@ -183,21 +515,14 @@ def apply_best_rule(lemma, msd, allprules, allsrules):
     if msd not in allprules and msd not in allsrules:
         return lemma # Haven't seen this inflection, so bail out
 
-    if msd in allsrules:
-        applicablerules = [(x[0],x[1],y) for x,y in allsrules[msd].items() if x[0] in base]
-        if applicablerules:
-            bestrule = max(applicablerules, key = lambda x: (len(x[0]), x[2], len(x[1])))
-            base = base.replace(bestrule[0], bestrule[1])
-
-    if msd in allprules:
-        applicablerules = [(x[0],x[1],y) for x,y in allprules[msd].items() if x[0] in base]
-        if applicablerules:
-            bestrule = max(applicablerules, key = lambda x: (x[2]))
-            base = base.replace(bestrule[0], bestrule[1])
+    for allrules in (allsrules, allprules):
+        if msd in allrules:
+            rules = allrules[msd]
+            best = rules.find(base)
+            if best is not None:
+                base = base.replace(rules.lhs[best], rules.rhs[best])
 
-    base = base.replace('<', '')
-    base = base.replace('>', '')
-    return base
+    return base.translate(_STRIP_MARKERS)
 
 
 def numleadingsyms(s, symbol):
@@ -227,6 +552,99 @@ def numtrailingsyms(s, symbol):
     """
     return len(s) - len(s.rstrip(symbol))
 
+
+def read_lines(filename):
+    """
+    Read the non-empty lines of a UTF-8 data file.
+    The whole file is read as bytes and split in one go, rather than decoded line by line.
+
+    Args:
+        filename    path of the file
+
+    Return:
+        list of lines, without line endings
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return [line.decode('utf8') for line in data.splitlines() if line]
+
+
+def _process_lang(lang, path, TEST, OUTPUT):
+    """
+    Train on one language and evaluate on its dev (or test) data.
+    Languages share no state, so main runs this in parallel worker processes.
+
+    Args:
+        lang    language code, the name of the data files
+        path    directory of the data files
+        TEST    evaluate on test instead of dev
+        OUTPUT  write the predictions to an output file
+
+    Return:
+        the language and the accuracy of the predictions
+    """
+    allprules, allsrules = defaultdict(Counter), defaultdict(Counter)
+    levenshtein.cache_clear()
+    _halign_offset.cache_clear()
+    lines = [line.split(u'\t') for line in read_lines(path + lang + ".trn")]
+
+    # First, test if language is predominantly suffixing or prefixing
+    # If prefixing, work with reversed strings
+    prefbias, suffbias = 0,0
+    for lemma, _, form in lines:
+        # halign only adds '_', so spaces and hyphens can be checked on the raw strings,
+        # and multiword or hyphenated pairs skipped before aligning them
+        if ' ' in lemma or ' ' in form or '-' in lemma or '-' in form:
+            continue
+        leadin, leadout, trailin, trailout = halign_bias(lemma, form)
+        prefbias += leadin + leadout
+        suffbias += trailin + trailout
+    reverse = prefbias > suffbias
+    for lemma, msd, form in lines: # Read in lines and extract transformation rules from pairs
+        if reverse:
+            lemma = lemma[::-1]
+            form = form[::-1]
+        prules, srules = prefix_suffix_rules_get(lemma, form)
+
+        allprules[msd].update(prules) # rules are (lhs, rhs) pairs, counted per msd
+        allsrules[msd].update(srules)
+
+    # Suffix rules: longest lhs first, then most frequent, then longest rhs. Prefix rules: most frequent
+    srulesets = build_rulesets(allsrules, lambda lhs, rhs, count: (len(lhs), count, len(rhs)))
+    prulesets = build_rulesets(allprules, lambda lhs, rhs, count: count)
+
+    # Run eval on dev
+    devlines = read_lines(path + lang + (".tst" if TEST else ".dev"))
+    # lemma and correct form are oriented once here: (lemma, msd, lemma to inflect, correct form to compare with)
+    devitems = []
+    for l in devlines:
+        lemma, msd, correct = l.split(u'\t')
+        if reverse:
+            devitems.append((lemma, msd, lemma[::-1], correct[::-1]))
+        else:
+            devitems.append((lemma, msd, lemma, correct))
+    numcorrect = 0
+    numguesses = 0
+    if OUTPUT:
+        outfile = open(path + lang + ".out", "w", encoding='utf8')
+    # apply best rules on the lemma based on msd; repeated queries reuse the earlier answer
+    outcache = {}
+    for lemma, msd, base, correct in devitems:
+        outform = outcache.get((base, msd))
+        if outform is None:
+            outform = outcache[(base, msd)] = apply_best_rule(base, msd, prulesets, srulesets)
+
+        if outform == correct:
+            numcorrect += 1
+        numguesses += 1
+        if OUTPUT:
+            outfile.write(lemma + "\t" + msd + "\t" + (outform[::-1] if reverse else outform) + "\n")
+
+    if OUTPUT:
+        outfile.close()
+
+    return lang, numcorrect/float(numguesses)
+
 ###############################################################################
 
 def main(argv):
@@ -259,72 +677,17 @@ def main(argv):
 
     # reading the file to access data
     totalavg, numlang = 0.0, 0
-    for lang in [os.path.splitext(d)[0] for d in os.listdir(path) if '.trn' in d]:
-        allprules, allsrules = {}, {}
-        if not os.path.isfile(path + lang +  ".trn"):
-            continue
-        lines = [line.strip() for line in open(path + lang + ".trn", "r", encoding='utf8') if line != '\n']
-
-        # First, test if language is predominantly suffixing or prefixing
-        # If prefixing, work with reversed strings
-        prefbias, suffbias = 0,0
-        for l in lines:
-            lemma, _, form = l.split(u'\t')
-            aligned = halign(lemma, form)
-            if ' ' not in aligned[0] and ' ' not in aligned[1] and '-' not in aligned[0] and '-' not in aligned[1]:
-                prefbias += numleadingsyms(aligned[0],'_') + numleadingsyms(aligned[1],'_')
-                suffbias += numtrailingsyms(aligned[0],'_') + numtrailingsyms(aligned[1],'_')
-        for l in lines: # Read in lines and extract transformation rules from pairs
-            lemma, msd, form = l.split(u'\t')
-            if prefbias > suffbias:
-                lemma = lemma[::-1]
-                form = form[::-1]
-            prules, srules = prefix_suffix_rules_get(lemma, form)
-
-            for rules, storage in [(prules, allprules), (srules, allsrules)]: # consolidating the msd creation codes using a loop
-                if msd not in storage and len(rules) > 0:
-                    storage[msd] = {}
-
-            for rules, storage in [(prules, allprules), (srules, allsrules)]: # consolidating the rule-counting codes
-                for r in rules:
-                    if (r[0], r[1]) in storage[msd]:
-                        storage[msd][(r[0], r[1])] += 1
-                    else:
-                        storage[msd][(r[0], r[1])] = 1
-
-
-        # Run eval on dev
-        devlines = [line.strip() for line in open(path + lang + ".dev", "r", encoding='utf8') if line != '\n']
-        if TEST:
-            devlines = [line.strip() for line in open(path + lang + ".tst", "r", encoding='utf8') if line != '\n']
-        numcorrect = 0
-        numguesses = 0
-        if OUTPUT:
-            outfile = open(path + lang + ".out", "w", encoding='utf8')
-        # apply best rules on the lemma based on msd
-        for l in devlines:
-            lemma, msd, correct = l.split(u'\t')
-            if prefbias > suffbias: # consolidate the prefix-biased condition
-                lemma = lemma[::-1]  # Reverse lemma for prefix alignment
-                outform = apply_best_rule(lemma, msd, allprules, allsrules)[::-1]  # Reverse the result
-                lemma = lemma[::-1]  # Restore original lemma
-            else:
-                outform = apply_best_rule(lemma, msd, allprules, allsrules)
-
-            if outform == correct:
-                numcorrect += 1
-            numguesses += 1
-            if OUTPUT:
-                outfile.write(lemma + "\t" + msd + "\t" + outform + "\n")
-
-        if OUTPUT:
-            outfile.close()
+    langs = [os.path.splitext(d)[0] for d in os.listdir(path) if '.trn' in d]
+    langs = [lang for lang in langs if os.path.isfile(path + lang + ".trn")]
+    with ProcessPoolExecutor(max_workers = max(1, min(len(langs), os.cpu_count() or 1))) as ex:
+        results = list(ex.map(_process_lang, langs, repeat(path), repeat(TEST), repeat(OUTPUT)))
 
-        # calculate the accuracy of prediction
+    # calculate the accuracy of prediction, in the order the languages were listed
+    for lang, accuracy in results:
         numlang += 1
-        totalavg += numcorrect/float(numguesses)
+        totalavg += accuracy
 
-        print(lang + ": " + str(str(numcorrect/float(numguesses)))[0:7])
+        print(lang + ": " + str(str(accuracy))[0:7])
 
     print("Average accuracy", totalavg/float(numlang))
 